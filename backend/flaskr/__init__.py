@@ -1,21 +1,79 @@
 import os
-from flask import Flask, request, abort, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from flask_cors import CORS
 import random
 
-from models import setup_db, Question, Category
+from profiling import profiler
+
+with profiler.step('import flask'):
+    from flask import Flask, request, abort, jsonify
+with profiler.step('import flask_cors'):
+    from flask_cors import CORS
+with profiler.step('import models'):
+    from models import setup_db, Question, Category, Result
+with profiler.step('import leaderboard'):
+    from leaderboard import ResultBuffer, Leaderboard, ALL_CATEGORIES
 
 QUESTIONS_PER_PAGE = 10
+LEADERBOARD_SIZE = 10
+RESULTS_FLUSH_SIZE = 100
+RESULTS_FLUSH_INTERVAL = 5
+RESULTS_MAX_PENDING = 10000
+LEADERBOARD_REFRESH_INTERVAL = 30
+MAX_PLAYER_NAME_LENGTH = 50
+# largest value the db's Integer columns can hold
+MAX_INTEGER = 2 ** 31 - 1
 
 
 def create_app(test_config=None):
     # create and configure the app
-    app = Flask(__name__)
-    setup_db(app)
+    with profiler.step('create_app: flask'):
+        app = Flask(__name__)
+
+    # bind the db lazily; no connection is made until the first request
+    with profiler.step('create_app: setup_db'):
+        setup_db(app)
 
     # allow cross-origin requests to /api/* from all origins
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    with profiler.step('create_app: cors'):
+        CORS(app, resources={r"/api/*": {"origins": "*"}})
+
+    def load_leaderboard():
+        """Seed the in-memory leaderboards from results already saved.
+
+        Every category gets a board, even if empty, so submissions can be
+        checked against it without querying the db. This is rerun after
+        each flush and whenever the boards go stale, to pick up results
+        saved by other worker processes.
+        """
+        best_first = (Result.score.desc(), Result.id)
+
+        # category ID 0 holds quizzes played with "ALL" selected
+        categories = [0] + [
+            category.id for category in Category.query.order_by(Category.id)
+        ]
+        boards = {
+            category: Result.query.filter(
+                Result.category == category
+            ).order_by(*best_first).limit(LEADERBOARD_SIZE).all()
+            for category in categories
+        }
+        boards[ALL_CATEGORIES] = Result.query.order_by(
+            *best_first).limit(LEADERBOARD_SIZE).all()
+
+        leaderboard.replace(boards)
+
+        # results still waiting to be written are not in the db yet
+        for result in results.pending():
+            leaderboard.add(result)
+
+    # quiz results are buffered and written in batches, while leaderboards
+    # are kept up to date in memory as each result arrives
+    with profiler.step('create_app: results'):
+        leaderboard = Leaderboard(LEADERBOARD_SIZE)
+        results = ResultBuffer(app, RESULTS_FLUSH_SIZE, RESULTS_FLUSH_INTERVAL,
+                               RESULTS_MAX_PENDING, on_flush=load_leaderboard)
+        app.extensions['results'] = results
+        app.extensions['leaderboard'] = leaderboard
+        app.before_first_request(load_leaderboard)
 
     @app.after_request
     def after_request(response):
@@ -235,6 +293,95 @@ def create_app(test_config=None):
             'question': question
         })
 
+    @app.route('/api/results', methods=['POST'])
+    def submit_result():
+        """Record the outcome of a finished quiz.
+
+        The result is added to the leaderboard immediately, but is only
+        written to the database with the next batch.
+        """
+        data = request.get_json() or {}
+
+        # category ID is 0 if "ALL" was selected for the quiz
+        quiz_category = data.get('quiz_category') or {}
+
+        try:
+            player = data['player'].strip()
+            category = int(quiz_category.get('id', 0))
+            score = int(data['score'])
+            total_questions = data.get('total_questions')
+            if total_questions is not None:
+                total_questions = int(total_questions)
+        except (KeyError, AttributeError, TypeError, ValueError):
+            abort(400)
+
+        # throw a 400 error if no player given or the score is impossible
+        if not player or score < 0 or (
+            total_questions is not None and total_questions < score
+        ):
+            abort(400)
+
+        # throw a 400 error for anything the db would refuse to store, so one
+        # bad result cannot fail the whole batch it is written with
+        if (
+            len(player) > MAX_PLAYER_NAME_LENGTH
+            or '\x00' in player
+            or score > MAX_INTEGER
+            or (total_questions is not None and total_questions > MAX_INTEGER)
+        ):
+            abort(400)
+
+        # raise a 404 error if the quiz category does not exist; checked
+        # against the leaderboards so a burst of submissions never hits the db
+        if not leaderboard.has_category(category):
+            abort(404)
+
+        result = Result(
+            player=player,
+            category=category,
+            score=score,
+            total_questions=total_questions
+        )
+        leaderboard.add(result)
+        results.add(result)
+
+        return jsonify({
+            'success': True,
+            'result': result.format()
+        })
+
+    @app.route('/api/leaderboard', defaults={'category_id': ALL_CATEGORIES})
+    @app.route('/api/categories/<int:category_id>/leaderboard')
+    def get_leaderboard(category_id):
+        """Return the top quiz results for a category, best first.
+
+        Without a category, results from every quiz are ranked together.
+
+        Querystring parameter:
+        limit - how many results to return (default and max 10); optional
+        """
+        category = None
+        if category_id is not ALL_CATEGORIES:
+            category = Category.query.filter(
+                Category.id == category_id).one_or_none()
+
+            if not category:
+                abort(404)
+
+        limit = request.args.get('limit', default=LEADERBOARD_SIZE, type=int)
+        if limit < 1:
+            abort(400)
+
+        # pick up results saved by other worker processes
+        if leaderboard.age() > LEADERBOARD_REFRESH_INTERVAL:
+            load_leaderboard()
+
+        return jsonify({
+            'leaderboard': leaderboard.top(category_id, limit),
+            'current_category': category.type if category else None,
+            'success': True
+        })
+
     #########
     # Custom error handlers
     #########
@@ -287,4 +434,6 @@ def create_app(test_config=None):
             'message': 'internal server error'
         }), 500
 
+    profiler.report()
+
     return app
@@ -0,0 +1,245 @@
+import atexit
+import bisect
+import itertools
+import threading
+import time
+import weakref
+
+from flask import has_app_context
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from models import db
+
+# errors that mean the db could not be reached, rather than that it
+# rejected the data, so the batch is worth trying again later
+RETRYABLE_ERRORS = (OperationalError, InterfaceError)
+
+# key of the board that ranks results from every category together
+ALL_CATEGORIES = None
+
+# every live buffer, so anything still pending can be written at exit
+_buffers = weakref.WeakSet()
+
+
+@atexit.register
+def flush_all():
+    """Flush every result buffer that is still alive."""
+    for buffer in list(_buffers):
+        buffer.flush()
+
+
+class ResultBuffer:
+    """Hold submitted quiz results in memory and write them in batches.
+
+    A flush is triggered once `max_size` results are waiting, or `max_age`
+    seconds after the first result was buffered, whichever comes first.
+    Each flush is a single bulk insert and a single commit.
+
+    If the db cannot be reached, the batch is kept and retried on the timer
+    only, and at most `max_pending` results are held; the oldest are
+    dropped beyond that. Rows the db rejects are dropped, not retried.
+
+    `on_flush` is called, inside an app context, after any flush that
+    saved results.
+    """
+
+    def __init__(self, app, max_size, max_age, max_pending=None,
+                 on_flush=None):
+        self.app = app
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_pending = max_pending or max_size * 100
+        self.on_flush = on_flush
+        self._pending = []
+        self._retrying = False
+        self._timer = None
+        self._lock = threading.Lock()
+        _buffers.add(self)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, result):
+        """Buffer a result, flushing straight away if the buffer is full."""
+        with self._lock:
+            self._pending.append(result)
+            self._trim()
+            # while the db is down, leave retries to the timer so requests
+            # are not held up by writes that are bound to fail
+            full = (
+                not self._retrying and len(self._pending) >= self.max_size
+            )
+            if not full:
+                self._schedule()
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered results to the db; return how many were saved."""
+        batch = self.clear()
+
+        if not batch:
+            return 0
+
+        # timer and exit flushes run outside of any request, so need their
+        # own app context to reach the db
+        if has_app_context():
+            return self._flush(batch)
+        with self.app.app_context():
+            return self._flush(batch)
+
+    def pending(self):
+        """Return the results still waiting to be written."""
+        with self._lock:
+            return list(self._pending)
+
+    def clear(self):
+        """Drop all buffered results without writing them and return them."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return batch
+
+    def _flush(self, batch):
+        saved = self._write(batch)
+        if saved and self.on_flush is not None:
+            try:
+                self.on_flush()
+            except Exception as e:
+                print(e)
+        return saved
+
+    def _write(self, batch):
+        try:
+            self._save(batch)
+            return len(batch)
+        except RETRYABLE_ERRORS as e:
+            print(e)
+            self._requeue(batch)
+            return 0
+        except Exception as e:
+            print(e)
+
+        # the db rejected part of the batch, so save the rows one at a time
+        # and drop those it will not accept rather than retrying them forever
+        saved = 0
+        for i, result in enumerate(batch):
+            try:
+                self._save([result])
+                saved += 1
+            except RETRYABLE_ERRORS as e:
+                print(e)
+                self._requeue(batch[i:])
+                break
+            except Exception as e:
+                print(f'dropping result {result.format()}: {e}')
+
+        return saved
+
+    def _save(self, batch):
+        try:
+            db.session.bulk_save_objects(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        with self._lock:
+            self._retrying = False
+
+    def _requeue(self, batch):
+        # keep the batch ahead of anything buffered since, for the next try
+        with self._lock:
+            self._pending[:0] = batch
+            self._retrying = True
+            self._trim()
+            self._schedule()
+
+    def _trim(self):
+        # caller must hold self._lock
+        dropped = len(self._pending) - self.max_pending
+        if dropped > 0:
+            print(f'result buffer full, dropping {dropped} oldest results')
+            del self._pending[:dropped]
+
+    def _schedule(self):
+        # caller must hold self._lock
+        if self._timer is None and self._pending:
+            self._timer = threading.Timer(self.max_age, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+
+class Leaderboard:
+    """Keep the top `size` results for each quiz category, best first.
+
+    Every result is ranked on its own category's board and on the
+    `ALL_CATEGORIES` board. Each board is a sorted list updated with
+    `bisect.insort` as results arrive, so reading a leaderboard never has
+    to query the db. Results are stored as formatted dicts rather than
+    model instances, so they outlive the session they were loaded in.
+    Ties on score are ranked by whoever got there first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.refreshed_at = None
+        self._boards = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, result):
+        """Place a result on its category's board and the overall board."""
+        entry = result.format()
+        key = (-entry['score'], next(self._sequence))
+
+        with self._lock:
+            self._insert(entry['category'], key, entry)
+            self._insert(ALL_CATEGORIES, key, entry)
+
+    def replace(self, boards):
+        """Swap every board for ones built from already-ranked results.
+
+        `boards` maps each known category, plus `ALL_CATEGORIES`, to its
+        results best first, e.g. as read back from the db. The new boards
+        are built aside and swapped in at once, so a failed or repeated
+        rebuild never leaves duplicates behind.
+        """
+        fresh = {}
+        for category, results in boards.items():
+            fresh[category] = [
+                ((-entry['score'], next(self._sequence)), entry)
+                for entry in (result.format() for result in results)
+            ][:self.size]
+
+        with self._lock:
+            self._boards = fresh
+            self.refreshed_at = time.monotonic()
+
+    def age(self):
+        """Return seconds since the boards were last replaced."""
+        if self.refreshed_at is None:
+            return float('inf')
+        return time.monotonic() - self.refreshed_at
+
+    def has_category(self, category):
+        """Return whether results can be ranked under a category."""
+        return category in self._boards
+
+    def top(self, category, limit=None):
+        """Return up to `limit` of the best results for a category."""
+        with self._lock:
+            board = self._boards.get(category, [])
+            return [entry for _, entry in board[:limit or self.size]]
+
+    def _insert(self, category, key, entry):
+        # caller must hold self._lock
+        board = self._boards.setdefault(category, [])
+        if len(board) >= self.size and key > board[-1][0]:
+            return
+
+        bisect.insort(board, (key, entry))
+        del board[self.size:]
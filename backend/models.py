@@ -1,25 +1,50 @@
 import os
-from dotenv import load_dotenv
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
 import json
 
-load_dotenv()
+from profiling import profiler
+
+with profiler.step('import dotenv'):
+    from dotenv import load_dotenv
+with profiler.step('import sqlalchemy'):
+    from sqlalchemy import Column, String, Integer
+with profiler.step('import flask_sqlalchemy'):
+    from flask_sqlalchemy import SQLAlchemy
 
-database_path = f"postgres://{os.getenv('DB_USER')}:{os.getenv('DB_PWD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+load_dotenv()
 
 db = SQLAlchemy()
 
+'''
+get_database_path()
+    builds the postgres URL from the DB_* environment variables
+'''
+def get_database_path():
+    return f"postgres://{os.getenv('DB_USER')}:{os.getenv('DB_PWD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    the database is not touched until the first request is handled
 '''
-def setup_db(app, database_path=database_path):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+def setup_db(app, database_path=None):
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_path or get_database_path()
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
-    db.create_all()
+
+    if initialise_db not in app.before_first_request_funcs:
+        app.before_first_request(initialise_db)
+
+'''
+initialise_db()
+    connects to the database and creates any missing tables
+'''
+def initialise_db():
+    with profiler.step('db: connect'):
+        db.engine.connect().close()
+    with profiler.step('db: schema check'):
+        db.create_all()
+    profiler.report()
 
 '''
 Question
@@ -77,4 +102,31 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+Result
+
+'''
+class Result(db.Model):  
+  __tablename__ = 'results'
+
+  id = Column(Integer, primary_key=True)
+  player = Column(String)
+  category = Column(Integer)
+  score = Column(Integer)
+  total_questions = Column(Integer)
+
+  def __init__(self, player, category, score, total_questions):
+    self.player = player
+    self.category = category
+    self.score = score
+    self.total_questions = total_questions
+
+  def format(self):
+    return {
+      'player': self.player,
+      'category': self.category,
+      'score': self.score,
+      'total_questions': self.total_questions
+    }
@@ -0,0 +1,63 @@
+import os
+import time
+from contextlib import contextmanager
+
+
+class StartupProfiler:
+    """Record how long each step of backend startup takes.
+
+    Steps are keyed by name, so re-running a step (e.g. calling `create_app`
+    again) replaces its previous timing rather than adding to it. Steps that
+    run inside another step are reported indented beneath it and are not
+    counted again in the total.
+    Set the `PROFILE_STARTUP` environment variable to print a report.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._depth = 0
+
+    @property
+    def enabled(self):
+        return os.getenv('PROFILE_STARTUP', '').lower() in ('1', 'true', 'yes')
+
+    @contextmanager
+    def step(self, name):
+        """Time the body of the `with` block and record it under `name`."""
+        depth = self._depth
+        # claim the slot up front so steps are reported in the order they
+        # started, with any nested steps listed after their parent
+        self.timings.pop(name, None)
+        self.timings[name] = (0.0, depth)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth = depth
+            self.timings[name] = (time.perf_counter() - start, depth)
+
+    def total(self, prefix=''):
+        """Return the time spent in top-level steps whose name has prefix."""
+        return sum(
+            seconds for name, (seconds, depth) in self.timings.items()
+            if depth == 0 and name.startswith(prefix)
+        )
+
+    def report(self):
+        """Print a timed breakdown of startup if profiling is enabled."""
+        if not self.enabled:
+            return
+
+        rows = [
+            ('  ' * depth + name, seconds)
+            for name, (seconds, depth) in self.timings.items()
+        ]
+        width = max([len(label) for label, _ in rows] + [len('total')])
+        print('Startup profile:')
+        for label, seconds in rows:
+            print(f'  {label:<{width}}  {seconds * 1000:8.2f} ms')
+        print(f'  {"total":<{width}}  {self.total() * 1000:8.2f} ms')
+
+
+profiler = StartupProfiler()
@@ -1,14 +1,35 @@
 import os
+import sys
+import time
+import uuid
+import subprocess
 import unittest
 import json
+from unittest import mock
 from dotenv import load_dotenv
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import Pool
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import db, setup_db, Question, Category, Result
+from leaderboard import ResultBuffer, Leaderboard, ALL_CATEGORIES
 
 load_dotenv()
 
+# maximum time allowed for importing the backend and running create_app
+STARTUP_BUDGET_SECONDS = 1.5
+
+# cold start run in a fresh interpreter, printing the recorded step timings
+COLD_START_SCRIPT = """
+import json
+import flaskr
+from profiling import profiler
+flaskr.create_app()
+print(json.dumps({name: seconds for name, (seconds, _) in profiler.timings.items()}))
+print(profiler.total('import') + profiler.total('create_app'))
+"""
+
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
@@ -36,7 +57,13 @@ class TriviaTestCase(unittest.TestCase):
 
     def tearDown(self):
         """Executed after reach test"""
-        pass
+        # drop unsaved results so no flush timer outlives the test
+        self.app.extensions['results'].clear()
+
+    def count_results(self, player):
+        """Return how many results are saved in the db for a player."""
+        with self.app.app_context():
+            return Result.query.filter(Result.player == player).count()
 
     def test_get_categories(self):
         res = self.client().get('/api/categories')
@@ -307,6 +334,407 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['message'], 'resource not found')
         self.assertTrue(data['error'], 404)
 
+    def test_submit_result(self):
+        body = {
+            'player': 'Ada',
+            'score': 4,
+            'total_questions': 5,
+            'quiz_category': {'type': 'Science', 'id': 1}
+        }
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        res = self.client().post('/api/results', data=json.dumps(body), headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['result']['player'], 'Ada')
+        self.assertEqual(data['result']['score'], 4)
+        self.assertEqual(data['result']['category'], 1)
+
+    def test_submit_result_missing_data(self):
+        body = {
+            'score': 4,
+            'quiz_category': {'type': 'Science', 'id': 1}
+        }
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        res = self.client().post('/api/results', data=json.dumps(body), headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['message'], 'bad request')
+
+    def test_submit_result_unstorable_values(self):
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        for player, score in [
+            ('Ada', 2 ** 31),
+            ('A\x00da', 4),
+            ('A' * 51, 4)
+        ]:
+            body = {
+                'player': player,
+                'score': score,
+                'quiz_category': {'type': 'Science', 'id': 1}
+            }
+            res = self.client().post('/api/results', data=json.dumps(body), headers=headers)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 400)
+            self.assertFalse(data['success'])
+            self.assertEqual(data['message'], 'bad request')
+
+        self.assertEqual(len(self.app.extensions['results']), 0)
+
+    def test_submit_result_invalid_category(self):
+        body = {
+            'player': 'Ada',
+            'score': 4,
+            'quiz_category': {'type': 'Nonsense', 'id': 1000}
+        }
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        res = self.client().post('/api/results', data=json.dumps(body), headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['message'], 'resource not found')
+
+    def test_submit_result_negative_category(self):
+        body = {
+            'player': 'Ada',
+            'score': 4,
+            'quiz_category': {'type': 'Nonsense', 'id': -5}
+        }
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        res = self.client().post('/api/results', data=json.dumps(body), headers=headers)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['message'], 'resource not found')
+
+    def test_results_flushed_in_batches(self):
+        player = f'Batch {uuid.uuid4()}'
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        for score in range(3):
+            body = {
+                'player': player,
+                'score': score,
+                'quiz_category': {'type': 'click', 'id': 0}
+            }
+            self.client().post('/api/results', data=json.dumps(body), headers=headers)
+
+        results = self.app.extensions['results']
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.count_results(player), 0)
+        self.assertEqual(results.flush(), 3)
+        self.assertEqual(len(results), 0)
+        self.assertEqual(self.count_results(player), 3)
+
+    def test_result_buffer_flushes_when_full(self):
+        player = f'Full {uuid.uuid4()}'
+        buffer = ResultBuffer(self.app, max_size=3, max_age=60)
+        self.addCleanup(buffer.clear)
+
+        with mock.patch.object(buffer, '_write', wraps=buffer._write) as write:
+            for score in range(2):
+                buffer.add(Result(player, 1, score, 5))
+            write.assert_not_called()
+            self.assertEqual(len(buffer), 2)
+
+            buffer.add(Result(player, 1, 2, 5))
+
+        write.assert_called_once()
+        self.assertEqual(len(write.call_args[0][0]), 3)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(self.count_results(player), 3)
+
+    def test_result_buffer_flushes_after_max_age(self):
+        player = f'Timed {uuid.uuid4()}'
+        buffer = ResultBuffer(self.app, max_size=100, max_age=0.1)
+        self.addCleanup(buffer.clear)
+
+        buffer.add(Result(player, 1, 3, 5))
+        self.assertEqual(len(buffer), 1)
+
+        # wait for the timer thread rather than calling flush()
+        deadline = time.monotonic() + 5
+        while self.count_results(player) == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(self.count_results(player), 1)
+
+    def test_result_buffer_keeps_failed_batch(self):
+        buffer = ResultBuffer(self.app, max_size=100, max_age=60)
+        self.addCleanup(buffer.clear)
+        first = Result('first', 1, 1, 5)
+        second = Result('second', 1, 2, 5)
+        late = Result('late', 1, 3, 5)
+        buffer.add(first)
+        buffer.add(second)
+
+        def fail(batch):
+            # a result arriving while the batch is being written
+            buffer.add(late)
+            raise OperationalError('INSERT', {}, Exception('db unavailable'))
+
+        with mock.patch.object(db.session, 'bulk_save_objects', side_effect=fail):
+            self.assertEqual(buffer.flush(), 0)
+
+        self.assertEqual(buffer._pending, [first, second, late])
+
+    def test_result_buffer_drops_rejected_rows(self):
+        player = f'Rejected {uuid.uuid4()}'
+        buffer = ResultBuffer(self.app, max_size=100, max_age=60)
+        self.addCleanup(buffer.clear)
+        buffer.add(Result(player, 1, 1, 5))
+        buffer.add(Result(player, 1, 2 ** 40, 5))
+        buffer.add(Result(player, 1, 3, 5))
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(self.count_results(player), 2)
+
+        # the rejected row does not block later writes
+        buffer.add(Result(player, 1, 4, 5))
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(self.count_results(player), 3)
+
+    def test_result_buffer_capped_while_db_down(self):
+        buffer = ResultBuffer(self.app, max_size=2, max_age=60, max_pending=3)
+        self.addCleanup(buffer.clear)
+        batch = [Result(str(i), 1, i, 5) for i in range(5)]
+        down = OperationalError('INSERT', {}, Exception('db unavailable'))
+
+        with mock.patch.object(
+                db.session, 'bulk_save_objects', side_effect=down) as save:
+            for result in batch:
+                buffer.add(result)
+
+        # only the first full buffer tries to write; later adds wait for
+        # the timer, and the oldest results are dropped beyond the cap
+        self.assertEqual(save.call_count, 1)
+        self.assertEqual(buffer._pending, batch[2:])
+
+    def test_leaderboard_survives_commit_on_first_request(self):
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Result(f'Seeded {uuid.uuid4()}', 1, 5, 5))
+            db.session.commit()
+
+        # first request seeds the leaderboard, then commits a new question
+        body = {
+            'question': 'Is this a test?',
+            'answer': 'Yes',
+            'category': 1,
+            'difficulty': 1
+        }
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        res = self.client().post('/api/questions', data=json.dumps(body), headers=headers)
+        self.assertEqual(res.status_code, 200)
+
+        res = self.client().get('/api/categories/1/leaderboard')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertGreater(len(data['leaderboard']), 0)
+
+    def test_get_leaderboard_by_category(self):
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        for player, score in [('Low', 0), ('High', 1000)]:
+            body = {
+                'player': player,
+                'score': score,
+                'quiz_category': {'type': 'Science', 'id': 1}
+            }
+            self.client().post('/api/results', data=json.dumps(body), headers=headers)
+
+        res = self.client().get('/api/categories/1/leaderboard')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['current_category'], 'Science')
+        self.assertLessEqual(len(data['leaderboard']), 10)
+        self.assertEqual(data['leaderboard'][0]['player'], 'High')
+        scores = [result['score'] for result in data['leaderboard']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def save_result_elsewhere(self, player):
+        """Save a result straight to the db, as another worker would.
+
+        The score grows with the clock so it tops boards left by earlier runs.
+        """
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(Result(player, 6, int(time.time()), 5))
+            db.session.commit()
+
+    def test_leaderboard_refreshed_after_flush(self):
+        player = f'Elsewhere {uuid.uuid4()}'
+        self.client().get('/api/categories/6/leaderboard')
+        self.save_result_elsewhere(player)
+
+        body = {
+            'player': f'Local {uuid.uuid4()}',
+            'score': 1,
+            'quiz_category': {'type': 'Sports', 'id': 6}
+        }
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        self.client().post('/api/results', data=json.dumps(body), headers=headers)
+        self.assertEqual(self.app.extensions['results'].flush(), 1)
+
+        res = self.client().get('/api/categories/6/leaderboard')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['leaderboard'][0]['player'], player)
+
+    def test_stale_leaderboard_refreshed_on_read(self):
+        player = f'Elsewhere {uuid.uuid4()}'
+        self.client().get('/api/categories/6/leaderboard')
+        self.save_result_elsewhere(player)
+
+        # not stale yet, so the result saved elsewhere is not shown
+        res = self.client().get('/api/categories/6/leaderboard')
+        data = json.loads(res.data)
+        self.assertNotIn(player, [result['player'] for result in data['leaderboard']])
+
+        self.app.extensions['leaderboard'].refreshed_at -= 3600
+        res = self.client().get('/api/categories/6/leaderboard')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['leaderboard'][0]['player'], player)
+
+    def test_get_leaderboard_all_categories(self):
+        player = f'Overall {uuid.uuid4()}'
+        body = {
+            'player': player,
+            'score': 2 ** 31 - 1,
+            'quiz_category': {'type': 'Art', 'id': 2}
+        }
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        self.client().post('/api/results', data=json.dumps(body), headers=headers)
+
+        res = self.client().get('/api/leaderboard?limit=3')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertIsNone(data['current_category'])
+        self.assertLessEqual(len(data['leaderboard']), 3)
+        self.assertIn(player, [result['player'] for result in data['leaderboard']])
+
+    def test_get_leaderboard_invalid_category(self):
+        res = self.client().get('/api/categories/1000/leaderboard')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(data['success'])
+        self.assertEqual(data['message'], 'resource not found')
+
+
+class LeaderboardTestCase(unittest.TestCase):
+    """This class represents the in-memory leaderboard test case"""
+
+    def test_keeps_top_results_in_order(self):
+        leaderboard = Leaderboard(3)
+        for player, score in [('a', 1), ('b', 5), ('c', 3), ('d', 4), ('e', 2)]:
+            leaderboard.add(Result(player, 1, score, 5))
+
+        top = leaderboard.top(1)
+
+        self.assertEqual([r['player'] for r in top], ['b', 'd', 'c'])
+        self.assertEqual(leaderboard.top(2), [])
+
+    def test_ties_ranked_by_arrival(self):
+        leaderboard = Leaderboard(2)
+        for player in ['first', 'second', 'third']:
+            leaderboard.add(Result(player, 0, 3, 5))
+
+        self.assertEqual([r['player'] for r in leaderboard.top(0)], ['first', 'second'])
+        self.assertEqual(len(leaderboard.top(0, limit=1)), 1)
+
+    def test_replace_does_not_duplicate(self):
+        leaderboard = Leaderboard(3)
+        boards = {
+            1: [Result('a', 1, 5, 5), Result('b', 1, 4, 5)],
+            ALL_CATEGORIES: [Result('a', 1, 5, 5)]
+        }
+        leaderboard.replace(boards)
+        leaderboard.replace(boards)
+
+        self.assertEqual([r['player'] for r in leaderboard.top(1)], ['a', 'b'])
+        self.assertEqual([r['player'] for r in leaderboard.top(ALL_CATEGORIES)], ['a'])
+        self.assertTrue(leaderboard.has_category(1))
+        self.assertFalse(leaderboard.has_category(-5))
+
+    def test_overall_board_ranks_every_category(self):
+        leaderboard = Leaderboard(2)
+        leaderboard.add(Result('science', 1, 2, 5))
+        leaderboard.add(Result('art', 2, 4, 5))
+        leaderboard.add(Result('all', 0, 3, 5))
+
+        top = leaderboard.top(ALL_CATEGORIES)
+
+        self.assertEqual([r['player'] for r in top], ['art', 'all'])
+        self.assertEqual([r['player'] for r in leaderboard.top(1)], ['science'])
+
+
+class StartupTestCase(unittest.TestCase):
+    """This class represents the backend startup test case"""
+
+    def test_create_app_does_not_connect_to_db(self):
+        with mock.patch.object(
+                Pool, 'connect',
+                side_effect=AssertionError('db connection made at startup')):
+            app = create_app()
+
+        self.assertFalse(app.got_first_request)
+
+    def test_startup_within_budget(self):
+        env = dict(os.environ)
+        env.pop('PROFILE_STARTUP', None)
+        output = subprocess.run(
+            [sys.executable, '-c', COLD_START_SCRIPT],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            stdout=subprocess.PIPE,
+            check=True,
+            universal_newlines=True
+        ).stdout.splitlines()
+        timings = json.loads(output[-2])
+        startup_time = float(output[-1])
+
+        for step in ['import flask', 'import models', 'create_app: setup_db',
+                     'create_app: results']:
+            self.assertIn(step, timings)
+        self.assertGreater(startup_time, 0)
+        self.assertLess(startup_time, STARTUP_BUDGET_SECONDS)
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -17,7 +17,10 @@ class QuizView extends Component {
       numCorrect: 0,
       currentQuestion: {},
       guess: '',
-      forceEnd: false
+      forceEnd: false,
+      player: '',
+      resultSubmitted: false,
+      leaderboard: []
     }
   }
 
@@ -89,6 +92,54 @@ class QuizView extends Component {
     })
   }
 
+  submitResult = (event) => {
+    event.preventDefault();
+    $.ajax({
+      url: `${Constants.SERVERPATH}/results`,
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        player: this.state.player,
+        score: this.state.numCorrect,
+        total_questions: this.state.previousQuestions.length,
+        quiz_category: this.state.quizCategory
+      }),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState({ resultSubmitted: true }, this.getLeaderboard)
+        return;
+      },
+      error: (error) => {
+        alert('Unable to submit score. Please try your request again')
+        return;
+      }
+    })
+  }
+
+  getLeaderboard = () => {
+    const categoryId = parseInt(this.state.quizCategory.id, 10)
+    const url = categoryId > 0
+      ? `${Constants.SERVERPATH}/categories/${categoryId}/leaderboard`
+      : `${Constants.SERVERPATH}/leaderboard`
+
+    $.ajax({
+      url: url,
+      type: "GET",
+      success: (result) => {
+        this.setState({ leaderboard: result.leaderboard })
+        return;
+      },
+      error: (error) => {
+        alert('Unable to load leaderboard. Please try your request again')
+        return;
+      }
+    })
+  }
+
   restartGame = () => {
     this.setState({
       quizCategory: null,
@@ -97,7 +148,10 @@ class QuizView extends Component {
       numCorrect: 0,
       currentQuestion: {},
       guess: '',
-      forceEnd: false
+      forceEnd: false,
+      player: '',
+      resultSubmitted: false,
+      leaderboard: []
     })
   }
 
@@ -127,11 +181,32 @@ class QuizView extends Component {
     return (
       <div className="quiz-play-holder">
         <div className="final-header"> Your Final Score is {this.state.numCorrect}</div>
+        {this.state.resultSubmitted
+          ? this.renderLeaderboard()
+          : (
+            <form onSubmit={this.submitResult}>
+              <input type="text" name="player" placeholder="Your name" onChange={this.handleChange} />
+              <input className="submit-guess button" type="submit" value="Submit Score" />
+            </form>
+          )}
         <div className="play-again button" onClick={this.restartGame}> Play Again? </div>
       </div>
     )
   }
 
+  renderLeaderboard() {
+    return (
+      <div className="leaderboard">
+        <div className="leaderboard-header">Leaderboard</div>
+        <ol>
+          {this.state.leaderboard.map((result, ind) => (
+            <li key={ind}>{result.player} - {result.score}</li>
+          ))}
+        </ol>
+      </div>
+    )
+  }
+
   evaluateAnswer = () => {
     const formatGuess = this.state.guess.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()]/g, "").toLowerCase()
     const answerArray = this.state.currentQuestion.answer.toLowerCase().split(' ');